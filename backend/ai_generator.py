@@ -1,4 +1,93 @@
-import anthropic
+import asyncio
+import json
+import random
+import threading
+from collections.abc import AsyncIterator
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+
+# The Anthropic SDK (and httpx/pydantic beneath it) is slow to import, so it is loaded
+# on first use; module-level ``anthropic`` is still reachable via __getattr__ below
+if TYPE_CHECKING:
+    import anthropic
+
+_MAX_RETRY_DELAY = 30.0
+
+
+def __getattr__(name: str):
+    if name == "anthropic":
+        import anthropic
+
+        return anthropic
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _is_retriable(error: Exception) -> bool:
+    """Whether a failed API call may succeed: rate limits, overloads, 5xx, network errors."""
+    import anthropic
+
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return isinstance(error, anthropic.APIConnectionError)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying: the server's Retry-After, else jittered backoff."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers["retry-after"]), _MAX_RETRY_DELAY)
+        except (KeyError, ValueError):
+            pass
+    return min(2**attempt + random.random(), _MAX_RETRY_DELAY)
+
+
+def _tool_key(block) -> tuple[str, str]:
+    """Identify a tool call by tool name and normalized input."""
+    return block.name, json.dumps(block.input, sort_keys=True)
+
+
+def _tool_result(tool_use_id: str, content: str) -> dict:
+    """Build a tool_result content block answering a tool_use block."""
+    return {"type": "tool_result", "tool_use_id": tool_use_id, "content": content}
+
+
+def _discard_tools(tasks) -> None:
+    """Cancel tool tasks whose results are not needed, retrieving errors of finished ones.
+
+    A call already running in its worker thread still completes, but its result and sources
+    are never used.
+    """
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()
+
+
+# One client (and connection pool) per API key for the whole process
+_SHARED_CLIENTS: dict[str, "anthropic.AsyncAnthropic"] = {}
+_SHARED_CLIENTS_LOCK = threading.Lock()
+
+
+def get_shared_client(api_key: str) -> "anthropic.AsyncAnthropic":
+    """Return the process-wide async client for an API key, creating it on first use."""
+    import anthropic
+    import httpx
+
+    with _SHARED_CLIENTS_LOCK:
+        client = _SHARED_CLIENTS.get(api_key)
+        if client is None:
+            client = anthropic.AsyncAnthropic(
+                api_key=api_key,
+                max_retries=0,  # AIGenerator retries with its own backoff
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+                    timeout=30.0,
+                ),
+            )
+            _SHARED_CLIENTS[api_key] = client
+        return client
 
 
 class AIGenerator:
@@ -6,6 +95,28 @@ class AIGenerator:
 
     MAX_TOOL_ROUNDS = 2
 
+    # Upper bound on in-flight Claude requests per generator to avoid rate-limit storms
+    MAX_CONCURRENT_REQUESTS = 20
+
+    # Let Claude decide whether to call a tool; shared read-only across requests
+    _TOOL_CHOICE_AUTO = MappingProxyType({"type": "auto"})
+
+    # Attempts per API call before a retriable error is raised
+    MAX_API_ATTEMPTS = 5
+
+    # Prompt-caching marker for the static prefix (system prompt + tool schema)
+    CACHE_CONTROL = {"type": "ephemeral"}
+
+    # Message Batches API: requests per batch and polling backoff bounds (seconds)
+    BATCH_SIZE = 1000
+    BATCH_POLL_INITIAL_DELAY = 5.0
+    BATCH_POLL_MAX_DELAY = 300.0
+
+    # Only the most recent history is sent, bounding per-call input tokens
+    MAX_HISTORY_CHARS = 4000
+
+    FALLBACK_RESPONSE = "I was unable to generate a response."
+
     # Static system prompt to avoid rebuilding on each call
     SYSTEM_PROMPT = """ You are an AI assistant specialized in course materials and educational content with access to comprehensive tools for course information.
 
@@ -37,14 +148,27 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    # System blocks precomputed once; the static block is shared and never mutated
+    _SYSTEM_BLOCK = {"type": "text", "text": SYSTEM_PROMPT, "cache_control": CACHE_CONTROL}
+    _HISTORY_PREFIX = "Previous conversation:\n"
+
+    def __init__(self, api_key: str, model: str, stream_tools: bool = True):
+        self.client = get_shared_client(api_key)
         self.model = model
+        # Stream tool rounds so tools start while the model is still decoding
+        self.stream_tools = stream_tools
+        self._request_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
 
-        # Pre-build base API parameters
-        self.base_params = {"model": self.model, "temperature": 0, "max_tokens": 800}
+        # Pre-build base API parameters (read-only, shared by concurrent calls)
+        self.base_params = MappingProxyType(
+            {"model": self.model, "temperature": 0, "max_tokens": 800}
+        )
+
+        # Last tool list seen and its prompt-caching copy, reused while callers pass the same list
+        self._tools_source = None
+        self._cacheable_tools_copy: list[dict] = []
 
-    def generate_response(
+    async def generate_response(
         self,
         query: str,
         conversation_history: str | None = None,
@@ -63,66 +187,353 @@ Provide only the direct answer to what was asked.
         Returns:
             Generated response as string
         """
+        chunks = self._respond(query, conversation_history, tools, tool_manager, stream=False)
+        return "".join([chunk async for chunk in chunks])
 
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
-        )
+    async def stream_response(
+        self,
+        query: str,
+        conversation_history: str | None = None,
+        tools: list | None = None,
+        tool_manager=None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream AI response text as it is decoded.
+
+        Every round is streamed, so a direct answer arrives token by token even with tools
+        available. Text the model writes in a round that then calls tools is streamed too,
+        separated from the next round's text by a blank line.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+
+        Yields:
+            Text deltas of the response
+        """
+        async for chunk in self._respond(
+            query, conversation_history, tools, tool_manager, stream=True
+        ):
+            yield chunk
+
+    async def _respond(
+        self,
+        query: str,
+        conversation_history: str | None,
+        tools: list | None,
+        tool_manager,
+        stream: bool,
+    ) -> AsyncIterator[str]:
+        """Run the tool loop, yielding the response text (as it is decoded when streaming)."""
 
-        # Prepare API call parameters efficiently
-        api_params = {
-            **self.base_params,
-            "messages": [{"role": "user", "content": query}],
-            "system": system_content,
-        }
+        messages = [{"role": "user", "content": query}]
+        system = self._build_system(conversation_history)
 
-        # Add tools if available
+        # Tool parameters are built once; loop state only decides whether they are sent
+        tool_params = {}
         if tools:
-            api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
-
-        # Initial API call
-        response = self.client.messages.create(**api_params)
-
-        # Tool calling loop: handle up to MAX_TOOL_ROUNDS sequential tool calls
-        for round_num in range(self.MAX_TOOL_ROUNDS):
-            if response.stop_reason != "tool_use" or not tool_manager:
-                break
-
-            # Append assistant's tool_use response
-            api_params["messages"].append({"role": "assistant", "content": response.content})
-
-            # Execute tools and collect results
-            tool_results = []
-            tool_failed = False
-            for block in response.content:
-                if block.type == "tool_use":
-                    try:
-                        result = tool_manager.execute_tool(block.name, **block.input)
-                    except Exception as e:
-                        result = f"Error executing tool: {e}"
-                        tool_failed = True
-                    tool_results.append(
-                        {"type": "tool_result", "tool_use_id": block.id, "content": result}
+            tool_params = {
+                "tools": self._cacheable_tools(tools),
+                "tool_choice": self._TOOL_CHOICE_AUTO,
+            }
+        tools_enabled = bool(tool_params)
+
+        # Tool results for this turn, keyed by (tool name, normalized input)
+        turn_cache: dict[tuple[str, str], str] = {}
+
+        # Streaming only: whether any text was yielded, and what separates it from the next
+        streamed = False
+        separator = ""
+
+        # Initial call plus up to MAX_TOOL_ROUNDS sequential tool calls
+        for round_num in range(self.MAX_TOOL_ROUNDS + 1):
+            # Tool calls of this round, keyed like turn_cache, possibly started mid-stream
+            started: dict[tuple[str, str], asyncio.Future] = {}
+            try:
+                round_streamed = False
+                async for kind, item in self._request_round(
+                    messages,
+                    system,
+                    tool_params if tools_enabled else {},
+                    tool_manager,
+                    turn_cache,
+                    started,
+                    stream,
+                ):
+                    if kind == "text":
+                        yield separator + item
+                        separator = ""
+                        streamed = round_streamed = True
+                    else:
+                        response = item
+                if (
+                    response.stop_reason != "tool_use"
+                    or not tool_manager
+                    or round_num == self.MAX_TOOL_ROUNDS
+                ):
+                    break
+
+                # Append assistant's tool_use response
+                messages.append({"role": "assistant", "content": response.content})
+
+                # Execute tools concurrently and collect results
+                tool_results, tool_failed = await self._run_tools(
+                    response.content, tool_manager, turn_cache, started
+                )
+
+                messages.append({"role": "user", "content": tool_results})
+
+                # On last allowed round or tool failure, disable tools to force text
+                is_last_round = round_num == self.MAX_TOOL_ROUNDS - 1
+                if tool_failed or is_last_round:
+                    tools_enabled = False
+            finally:
+                # Whatever this round started and did not consume must not outlive it
+                _discard_tools(started.values())
+
+            if round_streamed:
+                separator = "\n\n"
+
+        if not stream:
+            yield self._extract_text(response)
+        elif not streamed:
+            yield self.FALLBACK_RESPONSE
+
+    async def _request_round(
+        self,
+        messages: list[dict],
+        system: list[dict],
+        tool_params: dict,
+        tool_manager,
+        turn_cache: dict[tuple[str, str], str],
+        started: dict[tuple[str, str], asyncio.Future],
+        stream: bool,
+    ) -> AsyncIterator[tuple[str, Any]]:
+        """
+        Send one round's request, streamed when its text is wanted as it is decoded or when
+        tools may be started mid-decode.
+
+        Yields:
+            ("text", delta) tuples when streaming text, then one ("message", final message)
+        """
+        params = {"messages": messages, "system": system, **tool_params, **self.base_params}
+        start_tools = bool(tool_manager and tool_params and self.stream_tools)
+        if not (stream or start_tools):
+            yield "message", await self._create_with_retry(**params)
+            return
+
+        async for event in self._stream_round(
+            tool_manager if start_tools else None, turn_cache, started, stream, **params
+        ):
+            yield event
+
+    async def generate_batch(self, queries: list[tuple[str, str | None]]) -> list[str]:
+        """
+        Generate responses for many queries through the Message Batches API.
+
+        Batched requests cost half as much per token and still benefit from prompt caching,
+        but most batches finish within an hour and Anthropic only guarantees completion
+        within 24 hours - use this for offline work (evals, bulk Q&A), never on a request
+        path. Tools are not supported since the tool loop needs a round trip per step.
+
+        Args:
+            queries: (query, conversation_history) pairs
+
+        Returns:
+            Responses in the same order as queries; requests that did not succeed
+            get the fallback response
+        """
+        chunks = [
+            queries[start : start + self.BATCH_SIZE]
+            for start in range(0, len(queries), self.BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(self._run_batch(chunk) for chunk in chunks))
+        return [response for chunk_responses in results for response in chunk_responses]
+
+    async def _run_batch(self, queries: list[tuple[str, str | None]]) -> list[str]:
+        """Submit one message batch, poll until it ends, and collect responses in order."""
+        batch = await self.client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": str(index),
+                    "params": {
+                        **self.base_params,
+                        "messages": [{"role": "user", "content": query}],
+                        "system": self._build_system(conversation_history),
+                    },
+                }
+                for index, (query, conversation_history) in enumerate(queries)
+            ]
+        )
+
+        # Poll with exponential backoff until processing has ended
+        delay = self.BATCH_POLL_INITIAL_DELAY
+        while batch.processing_status != "ended":
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.BATCH_POLL_MAX_DELAY)
+            batch = await self.client.messages.batches.retrieve(batch.id)
+
+        responses = [self.FALLBACK_RESPONSE] * len(queries)
+        async for entry in await self.client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                responses[int(entry.custom_id)] = self._extract_text(entry.result.message)
+        return responses
+
+    def _cacheable_tools(self, tools) -> list[dict]:
+        """
+        Copy tools with the last one marked for prompt caching, so the whole tool schema is
+        cached along with the system prompt. The copy is rebuilt only when a different tool
+        list is passed, keeping the serialized schema byte-identical across calls.
+        """
+        if tools is not self._tools_source:
+            self._cacheable_tools_copy = [
+                *tools[:-1],
+                {**tools[-1], "cache_control": self.CACHE_CONTROL},
+            ]
+            self._tools_source = tools
+        return self._cacheable_tools_copy
+
+    def _build_system(self, conversation_history: str | None) -> list[dict]:
+        """
+        Build system blocks: the static prompt as a cached block and history in a separate
+        uncached block, so the cached prefix stays byte-identical across turns.
+        """
+        if not conversation_history:
+            return [self._SYSTEM_BLOCK]
+
+        if len(conversation_history) > self.MAX_HISTORY_CHARS:
+            conversation_history = (
+                "…[truncated]…\n" + conversation_history[-self.MAX_HISTORY_CHARS :]
+            )
+        return [
+            self._SYSTEM_BLOCK,
+            {"type": "text", "text": self._HISTORY_PREFIX + conversation_history},
+        ]
+
+    def _start_tools(
+        self,
+        tool_blocks: list,
+        tool_manager,
+        turn_cache: dict[tuple[str, str], str],
+        started: dict[tuple[str, str], asyncio.Future],
+    ):
+        """Schedule each distinct tool call not yet answered or running in this turn."""
+        for block in tool_blocks:
+            key = _tool_key(block)
+            if key not in turn_cache and key not in started:
+                started[key] = asyncio.ensure_future(
+                    asyncio.to_thread(
+                        tool_manager.execute_tool_with_sources, block.name, **block.input
                     )
+                )
 
-            api_params["messages"].append({"role": "user", "content": tool_results})
+    async def _run_tools(
+        self,
+        content,
+        tool_manager,
+        turn_cache: dict[tuple[str, str], str],
+        started: dict[tuple[str, str], asyncio.Future] | None = None,
+    ) -> tuple[list[dict], bool]:
+        """
+        Execute all tool_use blocks of a response concurrently.
 
-            # On last allowed round or tool failure, remove tools to force text
-            is_last_round = round_num == self.MAX_TOOL_ROUNDS - 1
-            if tool_failed or is_last_round:
-                api_params.pop("tools", None)
-                api_params.pop("tool_choice", None)
+        Calls already answered earlier in the turn (same tool and input) are served from
+        turn_cache instead of being executed again; successful results are added to it.
+        Calls already in started (kicked off while streaming) are awaited, not re-run; started
+        calls the final content does not ask for (from a failed stream attempt) are cancelled.
+        Sources of the executed calls are recorded on tool_manager in block order, so the
+        reported sources depend neither on which call finished last nor on discarded calls.
 
-            response = self.client.messages.create(**api_params)
+        Returns:
+            Tuple of (tool_result blocks in request order, whether any tool failed)
+        """
+        tool_blocks = [block for block in content if block.type == "tool_use"]
+        started = {} if started is None else started
+        wanted = {_tool_key(block) for block in tool_blocks}
+        _discard_tools([started.pop(key) for key in list(started) if key not in wanted])
+        self._start_tools(tool_blocks, tool_manager, turn_cache, started)
+        results = await asyncio.gather(*started.values(), return_exceptions=True)
+
+        outcomes = dict(turn_cache)
+        call_sources = {}
+        tool_failed = False
+        for key, result in zip(started, results, strict=True):
+            if isinstance(result, Exception):
+                result = f"Error executing tool: {result}"
+                tool_failed = True
+            else:
+                result, call_sources[key] = result
+                turn_cache[key] = result
+            outcomes[key] = result
+
+        for block in tool_blocks:
+            key = _tool_key(block)
+            if key in call_sources:
+                tool_manager.record_sources(block.name, call_sources[key])
+
+        tool_results = [_tool_result(block.id, outcomes[_tool_key(block)]) for block in tool_blocks]
+        return tool_results, tool_failed
+
+    async def _stream_round(
+        self,
+        tool_manager,
+        turn_cache: dict[tuple[str, str], str],
+        started: dict[tuple[str, str], asyncio.Future],
+        stream_text: bool,
+        **params,
+    ) -> AsyncIterator[tuple[str, Any]]:
+        """
+        Stream a Messages API request, bounded by the concurrency semaphore.
+
+        Given a tool_manager, each tool is started as soon as its tool_use block is complete
+        so tool latency overlaps the rest of the decode. Failures are retried like
+        _create_with_retry until the first text delta is yielded; tools already started are
+        kept.
 
-        return self._extract_text(response)
+        Yields:
+            ("text", delta) tuples if stream_text, then one ("message", final message)
+        """
+        for attempt in range(self.MAX_API_ATTEMPTS):
+            yielded = False
+            try:
+                async with self._request_semaphore, self.client.messages.stream(**params) as stream:
+                    async for event in stream:
+                        if event.type == "text" and stream_text:
+                            yielded = True
+                            yield "text", event.text
+                        elif (
+                            tool_manager
+                            and event.type == "content_block_stop"
+                            and event.content_block.type == "tool_use"
+                        ):
+                            self._start_tools(
+                                [event.content_block], tool_manager, turn_cache, started
+                            )
+                    message = await stream.get_final_message()
+            except Exception as e:
+                if yielded or attempt == self.MAX_API_ATTEMPTS - 1 or not _is_retriable(e):
+                    raise
+                await asyncio.sleep(_retry_delay(e, attempt))
+                continue
+            yield "message", message
+            return
+
+    async def _create_with_retry(self, **params):
+        """Send a Messages API request, retrying rate limits, overloads and network errors."""
+        for attempt in range(self.MAX_API_ATTEMPTS):
+            try:
+                async with self._request_semaphore:
+                    return await self.client.messages.create(**params)
+            except Exception as e:
+                if attempt == self.MAX_API_ATTEMPTS - 1 or not _is_retriable(e):
+                    raise
+                await asyncio.sleep(_retry_delay(e, attempt))
 
     def _extract_text(self, response) -> str:
         """Extract text from a response, handling mixed content blocks."""
-        for block in response.content:
-            if block.type == "text":
-                return block.text
-        return "I was unable to generate a response."
+        return next(
+            (block.text for block in response.content if block.type == "text"),
+            self.FALLBACK_RESPONSE,
+        )
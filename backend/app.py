@@ -2,19 +2,24 @@ import warnings
 
 warnings.filterwarnings("ignore", message="resource_tracker: There appear to be.*")
 
+import json
 import os
 
 from config import config
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from rag_system import RAGSystem
 
 # Initialize FastAPI app
-app = FastAPI(title="Course Materials RAG System", root_path="")
+app = FastAPI(
+    title="Course Materials RAG System",
+    root_path="",
+    default_response_class=ORJSONResponse,
+)
 
 # Add trusted host middleware for proxy
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
@@ -76,21 +81,51 @@ async def query_documents(request: QueryRequest):
             session_id = rag_system.session_manager.create_session()
 
         # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
+        answer, sources = await rag_system.query(request.query, session_id)
 
-        return QueryResponse(answer=answer, sources=sources, session_id=session_id)
+        # Plain dict: response_model validates it once, no intermediate model instance
+        return {"answer": answer, "sources": sources, "session_id": session_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
+@app.post("/api/query/stream")
+async def stream_query_documents(request: QueryRequest):
+    """Process a query and stream the answer as server-sent events"""
+    try:
+        session_id = request.session_id
+        if not session_id:
+            session_id = rag_system.session_manager.create_session()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    async def event_stream():
+        try:
+            async for event, data in rag_system.stream_query(request.query, session_id):
+                if event == "text":
+                    yield format_sse("text", {"text": data})
+                else:
+                    yield format_sse("done", {"sources": data, "session_id": session_id})
+        except Exception as e:
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encode one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.get("/api/courses", response_model=CourseStats)
 async def get_course_stats():
     """Get course analytics and statistics"""
     try:
         analytics = rag_system.get_course_analytics()
-        return CourseStats(
-            total_courses=analytics["total_courses"], course_titles=analytics["course_titles"]
-        )
+        return {
+            "total_courses": analytics["total_courses"],
+            "course_titles": analytics["course_titles"],
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
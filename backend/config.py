@@ -25,6 +25,10 @@ class Config:
     MAX_RESULTS: int = 5  # Maximum search results to return
     MAX_HISTORY: int = 0  # Number of conversation messages to remember
 
+    # Response cache settings
+    RESPONSE_CACHE_SIZE: int = 1024  # Maximum cached responses
+    RESPONSE_CACHE_SIMILARITY: float = 0.92  # Cosine similarity needed for a semantic hit
+
     # Database paths - use absolute path for reliability
     CHROMA_PATH: str = str(Path(__file__).parent / "chroma_db")  # ChromaDB storage location
 
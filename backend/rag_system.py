@@ -1,8 +1,11 @@
 import os
+from collections.abc import AsyncIterator
+from typing import Any
 
 from ai_generator import AIGenerator
 from document_processor import DocumentProcessor
 from models import Course
+from response_cache import CachingAIGenerator
 from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
 from session_manager import SessionManager
 from vector_store import VectorStore
@@ -19,15 +22,24 @@ class RAGSystem:
         self.vector_store = VectorStore(
             config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS
         )
-        self.ai_generator = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL)
+        self.ai_generator = CachingAIGenerator(
+            AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL),
+            self.vector_store.embedding_function,
+            max_entries=config.RESPONSE_CACHE_SIZE,
+            similarity_threshold=config.RESPONSE_CACHE_SIMILARITY,
+        )
         self.session_manager = SessionManager(config.MAX_HISTORY)
 
-        # Initialize search tools
-        self.tool_manager = ToolManager()
-        self.search_tool = CourseSearchTool(self.vector_store)
-        self.tool_manager.register_tool(self.search_tool)
-        self.outline_tool = CourseOutlineTool(self.vector_store)
-        self.tool_manager.register_tool(self.outline_tool)
+        # Initialize search tools; this manager supplies the tool definitions, while each
+        # query executes tools through a manager of its own
+        self.tool_manager = self._create_tool_manager()
+
+    def _create_tool_manager(self) -> ToolManager:
+        """Create a ToolManager with fresh search tools, so tracked sources are its own"""
+        tool_manager = ToolManager()
+        tool_manager.register_tool(CourseSearchTool(self.vector_store))
+        tool_manager.register_tool(CourseOutlineTool(self.vector_store))
+        return tool_manager
 
     def add_course_document(self, file_path: str) -> tuple[Course, int]:
         """
@@ -106,7 +118,7 @@ class RAGSystem:
 
         return total_courses, total_chunks
 
-    def query(self, query: str, session_id: str | None = None) -> tuple[str, list[str]]:
+    async def query(self, query: str, session_id: str | None = None) -> tuple[str, list[str]]:
         """
         Process a user query using the RAG system with tool-based search.
 
@@ -125,19 +137,21 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
 
+        # Tools run through a manager of this request's own, so concurrent queries
+        # interleaving at the awaits below cannot see or reset each other's sources
+        tool_manager = self._create_tool_manager()
+
         # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
+        response = await self.ai_generator.generate_response(
             query=prompt,
             conversation_history=history,
             tools=self.tool_manager.get_tool_definitions(),
-            tool_manager=self.tool_manager,
+            tool_manager=tool_manager,
+            cache_key=query,
         )
 
         # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
-
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
+        sources = tool_manager.get_last_sources()
 
         # Update conversation history
         if session_id:
@@ -146,6 +160,45 @@ class RAGSystem:
         # Return response with sources from tool searches
         return response, sources
 
+    async def stream_query(
+        self, query: str, session_id: str | None = None
+    ) -> AsyncIterator[tuple[str, Any]]:
+        """
+        Stream the response to a user query as it is generated.
+
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Yields:
+            ("text", delta) tuples while the answer is generated, then one ("sources", list)
+        """
+        prompt = f"""Answer this question about course materials: {query}"""
+
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+
+        tool_manager = self._create_tool_manager()
+
+        chunks = []
+        async for text in self.ai_generator.stream_response(
+            query=prompt,
+            conversation_history=history,
+            tools=self.tool_manager.get_tool_definitions(),
+            tool_manager=tool_manager,
+            cache_key=query,
+        ):
+            chunks.append(text)
+            yield "text", text
+
+        sources = tool_manager.get_last_sources()
+
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, "".join(chunks))
+
+        yield "sources", sources
+
     def get_course_analytics(self) -> dict:
         """Get analytics about the course catalog"""
         return {
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+
+import numpy as np
+
+
+class CachingAIGenerator:
+    """Semantic response cache in front of an AIGenerator"""
+
+    def __init__(
+        self,
+        generator,
+        embedding_function,
+        max_entries: int = 1024,
+        similarity_threshold: float = 0.92,
+    ):
+        self.generator = generator
+        self.embedding_function = embedding_function
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+
+        # Last tools object seen and its serialized form
+        self._tools_source = None
+        self._tools_source_json = json.dumps(None).encode()
+
+        # (context_key, query) -> (normalized query embedding, response), in LRU order
+        self._entries: OrderedDict[tuple[str, str], tuple[np.ndarray, str]] = OrderedDict()
+
+    def __getattr__(self, name):
+        # Anything not cached here is served by the wrapped generator
+        return getattr(self.generator, name)
+
+    async def generate_response(
+        self,
+        query: str,
+        conversation_history: str | None = None,
+        tools: list | None = None,
+        tool_manager=None,
+        cache_key: str | None = None,
+    ) -> str:
+        """
+        Return a cached response for the same or a semantically near query, or generate one.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            cache_key: The user's own question to match cached responses on, when query
+                wraps it in a prompt template (defaults to query)
+
+        Returns:
+            Generated response as string
+        """
+        exact_key, embedding, cached = await self._lookup(
+            query if cache_key is None else cache_key, conversation_history, tools
+        )
+        if cached is not None:
+            return cached
+
+        response = await self.generator.generate_response(
+            query=query,
+            conversation_history=conversation_history,
+            tools=tools,
+            tool_manager=tool_manager,
+        )
+        self._store_if_cacheable(exact_key, embedding, response, tool_manager)
+        return response
+
+    async def stream_response(
+        self,
+        query: str,
+        conversation_history: str | None = None,
+        tools: list | None = None,
+        tool_manager=None,
+        cache_key: str | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response, replaying a cached one in a single chunk on a hit.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            cache_key: The user's own question to match cached responses on, when query
+                wraps it in a prompt template (defaults to query)
+
+        Yields:
+            Text deltas of the response
+        """
+        exact_key, embedding, cached = await self._lookup(
+            query if cache_key is None else cache_key, conversation_history, tools
+        )
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        async for text in self.generator.stream_response(
+            query=query,
+            conversation_history=conversation_history,
+            tools=tools,
+            tool_manager=tool_manager,
+        ):
+            chunks.append(text)
+            yield text
+        self._store_if_cacheable(exact_key, embedding, "".join(chunks), tool_manager)
+
+    def clear(self):
+        """Drop all cached responses"""
+        self._entries.clear()
+
+    async def _lookup(
+        self, query: str, conversation_history: str | None, tools: list | None
+    ) -> tuple[tuple[str, str], np.ndarray | None, str | None]:
+        """Return (exact key, query embedding, cached response or None)"""
+        exact_key = (self._context_key(conversation_history, tools), query)
+        if exact_key in self._entries:
+            self._entries.move_to_end(exact_key)
+            return exact_key, None, self._entries[exact_key][1]
+
+        embedding = await asyncio.to_thread(self._embed, query)
+        return exact_key, embedding, self._find_similar(exact_key[0], embedding)
+
+    def _context_key(self, conversation_history: str | None, tools: list | None) -> str:
+        """Hash everything besides the query that shapes the response"""
+        digest = hashlib.sha1(self.generator.SYSTEM_PROMPT.encode())
+        digest.update((conversation_history or "").encode())
+        digest.update(self._tools_json(tools))
+        return digest.hexdigest()
+
+    def _tools_json(self, tools: list | None) -> bytes:
+        """Serialize tools for the context key, reusing the result for the same tools object"""
+        if tools is not self._tools_source:
+            self._tools_source_json = json.dumps(tools, sort_keys=True).encode()
+            self._tools_source = tools
+        return self._tools_source_json
+
+    def _embed(self, query: str) -> np.ndarray:
+        """Embed a query as a unit vector so cosine similarity is a dot product"""
+        embedding = np.asarray(self.embedding_function([query])[0], dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _find_similar(self, context_key: str, embedding: np.ndarray) -> str | None:
+        """Find the closest cached query under the same context above the threshold"""
+        candidates = [key for key in self._entries if key[0] == context_key]
+        if not candidates:
+            return None
+
+        matrix = np.stack([self._entries[key][0] for key in candidates])
+        similarities = matrix @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        self._entries.move_to_end(candidates[best])
+        return self._entries[candidates[best]][1]
+
+    def _store_if_cacheable(self, key, embedding, response: str, tool_manager):
+        """Cache a response unless it depends on tool sources that can't be replayed"""
+        if tool_manager is None or not tool_manager.get_last_sources():
+            self._store(key, embedding, response)
+
+    def _store(self, key: tuple[str, str], embedding: np.ndarray, response: str):
+        """Insert a response, evicting the least recently used entry when full"""
+        self._entries[key] = (embedding, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
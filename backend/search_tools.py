@@ -17,6 +17,10 @@ class Tool(ABC):
         """Execute the tool with given parameters"""
         pass
 
+    def execute_with_sources(self, **kwargs) -> tuple[str, list]:
+        """Execute the tool, returning its result with the sources this call cited"""
+        return self.execute(**kwargs), []
+
 
 class CourseSearchTool(Tool):
     """Tool for searching course content with semantic course name matching"""
@@ -64,6 +68,15 @@ class CourseSearchTool(Tool):
         Returns:
             Formatted search results or error message
         """
+        result, sources = self.execute_with_sources(query, course_name, lesson_number)
+        if sources:
+            self.last_sources = sources
+        return result
+
+    def execute_with_sources(
+        self, query: str, course_name: str | None = None, lesson_number: int | None = None
+    ) -> tuple[str, list]:
+        """Search like execute, returning the sources instead of storing them on the tool"""
 
         # Use the vector store's unified search interface
         results = self.store.search(
@@ -72,7 +85,7 @@ class CourseSearchTool(Tool):
 
         # Handle errors
         if results.error:
-            return results.error
+            return results.error, []
 
         # Handle empty results
         if results.is_empty():
@@ -81,13 +94,13 @@ class CourseSearchTool(Tool):
                 filter_info += f" in course '{course_name}'"
             if lesson_number:
                 filter_info += f" in lesson {lesson_number}"
-            return f"No relevant content found{filter_info}."
+            return f"No relevant content found{filter_info}.", []
 
         # Format and return results
         return self._format_results(results)
 
-    def _format_results(self, results: SearchResults) -> str:
-        """Format search results with course and lesson context"""
+    def _format_results(self, results: SearchResults) -> tuple[str, list]:
+        """Format search results with course and lesson context, plus their sources"""
         formatted = []
         sources = []  # Track sources for the UI
 
@@ -119,10 +132,7 @@ class CourseSearchTool(Tool):
 
             formatted.append(f"{header}\n{doc}")
 
-        # Store sources for retrieval
-        self.last_sources = sources
-
-        return "\n\n".join(formatted)
+        return "\n\n".join(formatted), sources
 
 
 class CourseOutlineTool(Tool):
@@ -159,19 +169,26 @@ class CourseOutlineTool(Tool):
         Returns:
             Formatted course outline or error message
         """
+        result, sources = self.execute_with_sources(course_title)
+        if sources:
+            self.last_sources = sources
+        return result
+
+    def execute_with_sources(self, course_title: str) -> tuple[str, list]:
+        """Build the outline like execute, returning the sources instead of storing them"""
         import json
 
         # Resolve course name using fuzzy matching
         resolved_title = self.store._resolve_course_name(course_title)
         if not resolved_title:
-            return f"No course found matching '{course_title}'"
+            return f"No course found matching '{course_title}'", []
 
         # Get course metadata from catalog
         try:
             results = self.store.course_catalog.get(ids=[resolved_title])
 
             if not results or not results.get("metadatas") or not results["metadatas"]:
-                return f"No course data found for '{resolved_title}'"
+                return f"No course data found for '{resolved_title}'", []
 
             metadata = results["metadatas"][0]
             title = metadata.get("title", "Unknown")
@@ -190,12 +207,10 @@ class CourseOutlineTool(Tool):
                 output_lines.append(f"{lesson_num}. {lesson_title}")
 
             # Track sources for UI
-            self.last_sources = [{"title": title, "url": course_link}]
-
-            return "\n".join(output_lines)
+            return "\n".join(output_lines), [{"title": title, "url": course_link}]
 
         except Exception as e:
-            return f"Error retrieving course outline: {str(e)}"
+            return f"Error retrieving course outline: {str(e)}", []
 
 
 class ToolManager:
@@ -203,6 +218,7 @@ class ToolManager:
 
     def __init__(self):
         self.tools = {}
+        self._tool_definitions: tuple[dict[str, Any], ...] = ()
 
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -212,9 +228,12 @@ class ToolManager:
             raise ValueError("Tool must have a 'name' in its definition")
         self.tools[tool_name] = tool
 
-    def get_tool_definitions(self) -> list:
+        # Definitions are static, so build them once per registration rather than per query
+        self._tool_definitions = tuple(tool.get_tool_definition() for tool in self.tools.values())
+
+    def get_tool_definitions(self) -> tuple[dict[str, Any], ...]:
         """Get all tool definitions for Anthropic tool calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+        return self._tool_definitions
 
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""
@@ -223,6 +242,23 @@ class ToolManager:
 
         return self.tools[tool_name].execute(**kwargs)
 
+    def execute_tool_with_sources(self, tool_name: str, **kwargs) -> tuple[str, list]:
+        """Execute a tool by name, returning its result and the sources of this call
+
+        Nothing is stored on the tools, so calls may run concurrently; pass the sources of
+        the calls actually used to record_sources.
+        """
+        if tool_name not in self.tools:
+            return f"Tool '{tool_name}' not found", []
+
+        return self.tools[tool_name].execute_with_sources(**kwargs)
+
+    def record_sources(self, tool_name: str, sources: list):
+        """Track sources of a call made with execute_tool_with_sources, as execute_tool does"""
+        tool = self.tools.get(tool_name)
+        if sources and hasattr(tool, "last_sources"):
+            tool.last_sources = sources
+
     def get_last_sources(self) -> list:
         """Get sources from the last search operation"""
         # Check all tools for last_sources attribute
@@ -7,8 +7,9 @@ backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 import tempfile
+from types import SimpleNamespace
 
 
 @pytest.fixture
@@ -22,6 +23,8 @@ def mock_config():
     config.CHUNK_OVERLAP = 100
     config.MAX_RESULTS = 5
     config.MAX_HISTORY = 2
+    config.RESPONSE_CACHE_SIZE = 1024
+    config.RESPONSE_CACHE_SIMILARITY = 0.92
 
     # Use a temporary directory for test database
     with tempfile.TemporaryDirectory() as tmpdir:
@@ -29,56 +32,96 @@ def mock_config():
         yield config
 
 
-@pytest.fixture
-def mock_rag_system():
-    """Mock RAGSystem with commonly used methods"""
-    rag = MagicMock()
+class _Recorder:
+    """Lightweight stand-in for MagicMock: records calls, then returns or raises"""
+
+    def __init__(self, return_value=None, side_effect=None):
+        self.return_value = return_value
+        self.side_effect = side_effect
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        if isinstance(self.side_effect, BaseException) or (
+            isinstance(self.side_effect, type) and issubclass(self.side_effect, BaseException)
+        ):
+            raise self.side_effect
+        if self.side_effect is not None:
+            return self.side_effect(*args, **kwargs)
+        return self.return_value
+
+    def assert_called_once(self):
+        assert len(self.calls) == 1, f"Expected 1 call, got {len(self.calls)}"
+
+    def assert_called_once_with(self, *args, **kwargs):
+        self.assert_called_once()
+        assert self.calls[0] == (args, kwargs), f"Expected call {(args, kwargs)}, got {self.calls[0]}"
+
+
+class _AsyncRecorder(_Recorder):
+    """_Recorder for coroutine methods"""
+
+    async def __call__(self, *args, **kwargs):
+        return super().__call__(*args, **kwargs)
+
 
+def seed_mock_rag_system(rag):
+    """Replace a mock RAGSystem's methods with fresh recorders seeded with predefined responses"""
     # Mock session_manager
-    rag.session_manager.create_session.return_value = "test-session-123"
-    rag.session_manager.get_conversation_history.return_value = None
+    rag.session_manager = SimpleNamespace(
+        create_session=_Recorder(return_value="test-session-123"),
+        get_conversation_history=_Recorder(return_value=None),
+    )
 
     # Mock query method to return response with sources
-    rag.query.return_value = (
+    rag.query = _AsyncRecorder(return_value=(
         "This is a test answer about the course content.",
         [
             {"title": "Introduction to Python - Lesson 1", "url": "https://example.com/python"},
             {"title": "Python Basics - Lesson 2", "url": "https://example.com/basics"}
         ]
-    )
+    ))
+
+    # Mock streaming query to emit the same answer in pieces, then its sources
+    async def stream_query(query, session_id=None):
+        answer, sources = rag.query.return_value
+        midpoint = len(answer) // 2
+        yield "text", answer[:midpoint]
+        yield "text", answer[midpoint:]
+        yield "sources", sources
+
+    rag.stream_query = _Recorder(side_effect=stream_query)
 
     # Mock course analytics
-    rag.get_course_analytics.return_value = {
+    rag.get_course_analytics = _Recorder(return_value={
         "total_courses": 3,
         "course_titles": ["Python Course", "JavaScript Course", "Data Science Course"]
-    }
+    })
 
     # Mock vector store methods
-    rag.vector_store.get_course_count.return_value = 3
-    rag.vector_store.get_existing_course_titles.return_value = [
-        "Python Course",
-        "JavaScript Course",
-        "Data Science Course"
-    ]
+    rag.vector_store = SimpleNamespace(
+        get_course_count=_Recorder(return_value=3),
+        get_existing_course_titles=_Recorder(return_value=[
+            "Python Course",
+            "JavaScript Course",
+            "Data Science Course"
+        ]),
+    )
 
     return rag
 
 
-@pytest.fixture
-def sample_query_request():
-    """Sample query request data"""
-    return {
-        "query": "What is Python?",
-        "session_id": "test-session-123"
-    }
+@pytest.fixture(scope="session")
+def mock_rag_system():
+    """Mock RAGSystem shared across the session; reseed it per test with seed_mock_rag_system"""
+    return seed_mock_rag_system(SimpleNamespace())
 
 
-@pytest.fixture
-def sample_query_request_no_session():
-    """Sample query request without session ID"""
-    return {
-        "query": "Explain variables in JavaScript"
-    }
+@pytest.fixture(autouse=True)
+def reset_mock_rag_system(request):
+    """Restore the shared mocked RAGSystem's calls and return values before each test using it"""
+    if "mock_rag_system" in request.fixturenames:
+        seed_mock_rag_system(request.getfixturevalue("mock_rag_system"))
 
 
 @pytest.fixture
@@ -94,10 +137,11 @@ def sample_sources():
 @pytest.fixture
 def ai_generator_mock():
     """Mock AIGenerator for unit tests"""
-    with patch("ai_generator.anthropic.Anthropic") as MockClient:
+    with patch("ai_generator.anthropic.AsyncAnthropic") as MockClient:
         from ai_generator import AIGenerator
-        gen = AIGenerator(api_key="test-key", model="test-model")
+        gen = AIGenerator(api_key="test-key", model="test-model", stream_tools=False)
         gen.client = MockClient()
+        gen.client.messages.create = AsyncMock()
         yield gen
 
 
@@ -106,6 +150,7 @@ def tool_manager_mock():
     """Mock ToolManager for testing tool execution"""
     mgr = MagicMock()
     mgr.execute_tool = MagicMock(return_value="Mock tool result")
+    mgr.execute_tool_with_sources = MagicMock(return_value=("Mock tool result", []))
     mgr.get_tool_definitions.return_value = [
         {
             "name": "search_course_content",
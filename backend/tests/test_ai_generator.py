@@ -1,10 +1,19 @@
 """Unit tests for AIGenerator sequential tool calling"""
 
+import asyncio
+import gc
+import threading
+import time
 from types import SimpleNamespace
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import ai_generator
+import anthropic
+import httpx
 import pytest
 from ai_generator import AIGenerator
+from search_tools import CourseSearchTool, ToolManager
+from vector_store import SearchResults
 
 pytestmark = pytest.mark.unit
 
@@ -17,15 +26,53 @@ def make_tool_use_block(tool_id, name, input_args):
     return SimpleNamespace(type="tool_use", id=tool_id, name=name, input=input_args)
 
 
+def make_streamed_text_block(*deltas):
+    return SimpleNamespace(type="text", text="".join(deltas), deltas=deltas)
+
+
 def make_response(stop_reason, content_blocks):
     return SimpleNamespace(stop_reason=stop_reason, content=content_blocks)
 
 
+def make_search_results(course_title):
+    return SearchResults(
+        documents=["content"], metadata=[{"course_title": course_title}], distances=[0.1]
+    )
+
+
+class FakeStream:
+    """Stand-in for client.messages.stream(...): text events per delta, content_block_stop per
+    block, then the final message"""
+
+    def __init__(self, message, before_final=None):
+        self.message = message
+        self.before_final = before_final
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for index, block in enumerate(self.message.content):
+            if block.type == "text":
+                for delta in getattr(block, "deltas", [block.text]):
+                    yield SimpleNamespace(type="text", text=delta)
+            yield SimpleNamespace(type="content_block_stop", index=index, content_block=block)
+
+    async def get_final_message(self):
+        if self.before_final:
+            await self.before_final()
+        return self.message
+
+
 @pytest.fixture
 def generator():
-    with patch("ai_generator.anthropic.Anthropic") as MockClient:
-        gen = AIGenerator(api_key="test-key", model="test-model")
+    with patch("ai_generator.anthropic.AsyncAnthropic") as MockClient:
+        gen = AIGenerator(api_key="test-key", model="test-model", stream_tools=False)
         gen.client = MockClient()
+        gen.client.messages.create = AsyncMock()
         yield gen
 
 
@@ -33,44 +80,80 @@ def generator():
 def tool_manager():
     mgr = MagicMock()
     mgr.execute_tool = MagicMock(return_value="tool result text")
+    # Concurrent calls go through execute_tool_with_sources; route them to execute_tool
+    mgr.execute_tool_with_sources = MagicMock(
+        side_effect=lambda name, **kwargs: (mgr.execute_tool(name, **kwargs), [])
+    )
     return mgr
 
 
+@pytest.fixture
+def search_store():
+    store = MagicMock()
+    store.get_course_link.return_value = None
+    return store
+
+
+@pytest.fixture
+def search_manager(search_store):
+    """Real ToolManager whose search tool runs over a mocked vector store"""
+    manager = ToolManager()
+    manager.register_tool(CourseSearchTool(search_store))
+    return manager
+
+
 @pytest.fixture
 def sample_tools():
     return [{"name": "search_course_content", "description": "Search", "input_schema": {}}]
 
 
+class TestSharedClient:
+    def test_generators_share_one_client_per_api_key(self, monkeypatch):
+        monkeypatch.setattr(ai_generator, "_SHARED_CLIENTS", {})
+        with patch(
+            "ai_generator.anthropic.AsyncAnthropic", side_effect=lambda **kwargs: MagicMock()
+        ) as MockClient:
+            first = AIGenerator(api_key="key-a", model="test-model")
+            second = AIGenerator(api_key="key-a", model="test-model")
+            other = AIGenerator(api_key="key-b", model="test-model")
+
+        assert first.client is second.client
+        assert other.client is not first.client
+        assert MockClient.call_count == 2
+
+
 class TestDirectTextResponse:
-    def test_no_tools_returns_text(self, generator):
+    async def test_no_tools_returns_text(self, generator):
         generator.client.messages.create.return_value = make_response(
             "end_turn", [make_text_block("Hello!")]
         )
-        result = generator.generate_response("hi")
+        result = await generator.generate_response("hi")
         assert result == "Hello!"
         assert generator.client.messages.create.call_count == 1
 
-    def test_tools_provided_but_claude_responds_with_text(
+    async def test_tools_provided_but_claude_responds_with_text(
         self, generator, tool_manager, sample_tools
     ):
         generator.client.messages.create.return_value = make_response(
             "end_turn", [make_text_block("Direct answer")]
         )
-        result = generator.generate_response("hi", tools=sample_tools, tool_manager=tool_manager)
+        result = await generator.generate_response(
+            "hi", tools=sample_tools, tool_manager=tool_manager
+        )
         assert result == "Direct answer"
         assert generator.client.messages.create.call_count == 1
         tool_manager.execute_tool.assert_not_called()
 
 
 class TestSingleToolRound:
-    def test_one_tool_call_then_text(self, generator, tool_manager, sample_tools):
+    async def test_one_tool_call_then_text(self, generator, tool_manager, sample_tools):
         tool_response = make_response(
             "tool_use", [make_tool_use_block("t1", "search_course_content", {"query": "python"})]
         )
         text_response = make_response("end_turn", [make_text_block("Here are the results")])
         generator.client.messages.create.side_effect = [tool_response, text_response]
 
-        result = generator.generate_response(
+        result = await generator.generate_response(
             "search python", tools=sample_tools, tool_manager=tool_manager
         )
 
@@ -82,14 +165,14 @@ class TestSingleToolRound:
         second_call_kwargs = generator.client.messages.create.call_args_list[1][1]
         assert "tools" in second_call_kwargs
 
-    def test_tool_results_included_in_messages(self, generator, tool_manager, sample_tools):
+    async def test_tool_results_included_in_messages(self, generator, tool_manager, sample_tools):
         tool_response = make_response(
             "tool_use", [make_tool_use_block("t1", "search_course_content", {"query": "test"})]
         )
         text_response = make_response("end_turn", [make_text_block("Answer")])
         generator.client.messages.create.side_effect = [tool_response, text_response]
 
-        generator.generate_response("test", tools=sample_tools, tool_manager=tool_manager)
+        await generator.generate_response("test", tools=sample_tools, tool_manager=tool_manager)
 
         second_call_kwargs = generator.client.messages.create.call_args_list[1][1]
         messages = second_call_kwargs["messages"]
@@ -101,9 +184,58 @@ class TestSingleToolRound:
         assert messages[2]["content"][0]["type"] == "tool_result"
         assert messages[2]["content"][0]["content"] == "tool result text"
 
+    async def test_multiple_tool_blocks_in_one_round(self, generator, tool_manager, sample_tools):
+        tool_response = make_response(
+            "tool_use",
+            [
+                make_tool_use_block("t1", "search_course_content", {"query": "a"}),
+                make_tool_use_block("t2", "search_course_content", {"query": "b"}),
+            ],
+        )
+        text_response = make_response("end_turn", [make_text_block("Combined")])
+        generator.client.messages.create.side_effect = [tool_response, text_response]
+        tool_manager.execute_tool.side_effect = lambda name, query: f"result {query}"
+
+        await generator.generate_response("q", tools=sample_tools, tool_manager=tool_manager)
+
+        assert tool_manager.execute_tool.call_count == 2
+        second_call_kwargs = generator.client.messages.create.call_args_list[1][1]
+        tool_results = second_call_kwargs["messages"][2]["content"]
+        assert [r["tool_use_id"] for r in tool_results] == ["t1", "t2"]
+        assert [r["content"] for r in tool_results] == ["result a", "result b"]
+
+    async def test_sources_follow_block_order_not_completion_order(
+        self, generator, search_manager, search_store, sample_tools
+    ):
+        rust_searched = threading.Event()
+
+        def search(query, course_name=None, lesson_number=None):
+            if query == "Python":
+                # The first block's search finishes after the second block's
+                rust_searched.wait(1)
+                time.sleep(0.05)
+            else:
+                rust_searched.set()
+            return make_search_results(query)
+
+        search_store.search.side_effect = search
+        tool_response = make_response(
+            "tool_use",
+            [
+                make_tool_use_block("t1", "search_course_content", {"query": "Python"}),
+                make_tool_use_block("t2", "search_course_content", {"query": "Rust"}),
+            ],
+        )
+        text_response = make_response("end_turn", [make_text_block("Combined")])
+        generator.client.messages.create.side_effect = [tool_response, text_response]
+
+        await generator.generate_response("q", tools=sample_tools, tool_manager=search_manager)
+
+        assert search_manager.get_last_sources() == [{"title": "Rust", "url": None}]
+
 
 class TestTwoSequentialToolRounds:
-    def test_two_rounds_then_text(self, generator, tool_manager, sample_tools):
+    async def test_two_rounds_then_text(self, generator, tool_manager, sample_tools):
         tool_response_1 = make_response(
             "tool_use", [make_tool_use_block("t1", "get_course_outline", {"course_title": "MCP"})]
         )
@@ -120,7 +252,7 @@ class TestTwoSequentialToolRounds:
         ]
         tool_manager.execute_tool.side_effect = ["outline result", "search result"]
 
-        result = generator.generate_response(
+        result = await generator.generate_response(
             "complex query", tools=sample_tools, tool_manager=tool_manager
         )
 
@@ -132,7 +264,7 @@ class TestTwoSequentialToolRounds:
         third_call_kwargs = generator.client.messages.create.call_args_list[2][1]
         assert "tools" not in third_call_kwargs
 
-    def test_messages_accumulate_across_rounds(self, generator, tool_manager, sample_tools):
+    async def test_messages_accumulate_across_rounds(self, generator, tool_manager, sample_tools):
         tool_response_1 = make_response(
             "tool_use", [make_tool_use_block("t1", "get_course_outline", {"course_title": "X"})]
         )
@@ -148,7 +280,7 @@ class TestTwoSequentialToolRounds:
         ]
         tool_manager.execute_tool.side_effect = ["result1", "result2"]
 
-        generator.generate_response("q", tools=sample_tools, tool_manager=tool_manager)
+        await generator.generate_response("q", tools=sample_tools, tool_manager=tool_manager)
 
         # Final call messages: user, assistant, tool_result, assistant, tool_result
         final_call_kwargs = generator.client.messages.create.call_args_list[2][1]
@@ -157,9 +289,33 @@ class TestTwoSequentialToolRounds:
         roles = [m["role"] for m in messages]
         assert roles == ["user", "assistant", "user", "assistant", "user"]
 
+    async def test_repeated_call_reuses_earlier_result(self, generator, tool_manager, sample_tools):
+        repeated_call = ("search_course_content", {"query": "python"})
+        tool_response_1 = make_response("tool_use", [make_tool_use_block("t1", *repeated_call)])
+        tool_response_2 = make_response("tool_use", [make_tool_use_block("t2", *repeated_call)])
+        text_response = make_response("end_turn", [make_text_block("Final answer")])
+
+        generator.client.messages.create.side_effect = [
+            tool_response_1,
+            tool_response_2,
+            text_response,
+        ]
+
+        result = await generator.generate_response(
+            "q", tools=sample_tools, tool_manager=tool_manager
+        )
+
+        assert result == "Final answer"
+        assert tool_manager.execute_tool.call_count == 1
+        final_messages = generator.client.messages.create.call_args_list[2][1]["messages"]
+        assert final_messages[4]["content"][0]["tool_use_id"] == "t2"
+        assert final_messages[4]["content"][0]["content"] == "tool result text"
+
 
 class TestErrorHandling:
-    def test_tool_exception_sends_error_as_result(self, generator, tool_manager, sample_tools):
+    async def test_tool_exception_sends_error_as_result(
+        self, generator, tool_manager, sample_tools
+    ):
         tool_response = make_response(
             "tool_use", [make_tool_use_block("t1", "search_course_content", {"query": "test"})]
         )
@@ -167,7 +323,9 @@ class TestErrorHandling:
         generator.client.messages.create.side_effect = [tool_response, text_response]
         tool_manager.execute_tool.side_effect = Exception("connection failed")
 
-        result = generator.generate_response("test", tools=sample_tools, tool_manager=tool_manager)
+        result = await generator.generate_response(
+            "test", tools=sample_tools, tool_manager=tool_manager
+        )
 
         assert result == "Sorry, error occurred"
         # After error, tools should be removed to force text
@@ -179,7 +337,9 @@ class TestErrorHandling:
         assert "Error executing tool" in tool_result_content
         assert "connection failed" in tool_result_content
 
-    def test_tool_not_found_string_passed_through(self, generator, tool_manager, sample_tools):
+    async def test_tool_not_found_string_passed_through(
+        self, generator, tool_manager, sample_tools
+    ):
         tool_response = make_response(
             "tool_use", [make_tool_use_block("t1", "bad_tool", {"query": "test"})]
         )
@@ -187,41 +347,127 @@ class TestErrorHandling:
         generator.client.messages.create.side_effect = [tool_response, text_response]
         tool_manager.execute_tool.return_value = "Tool 'bad_tool' not found"
 
-        result = generator.generate_response("test", tools=sample_tools, tool_manager=tool_manager)
+        result = await generator.generate_response(
+            "test", tools=sample_tools, tool_manager=tool_manager
+        )
 
         assert result == "No tool found"
 
 
+class TestRetries:
+    @staticmethod
+    def make_rate_limit_error(headers=None):
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        response = httpx.Response(429, headers=headers, request=request)
+        return anthropic.RateLimitError("rate limited", response=response, body=None)
+
+    @pytest.fixture
+    def sleep(self, monkeypatch):
+        sleep = AsyncMock()
+        monkeypatch.setattr(ai_generator.asyncio, "sleep", sleep)
+        return sleep
+
+    async def test_rate_limit_retried_until_success(self, generator, sleep):
+        generator.client.messages.create.side_effect = [
+            self.make_rate_limit_error(),
+            self.make_rate_limit_error({"retry-after": "2"}),
+            make_response("end_turn", [make_text_block("Recovered")]),
+        ]
+
+        result = await generator.generate_response("hi")
+
+        assert result == "Recovered"
+        assert generator.client.messages.create.call_count == 3
+        assert sleep.await_count == 2
+        # Server-provided Retry-After wins over exponential backoff
+        assert sleep.await_args_list[1].args == (2.0,)
+
+    async def test_gives_up_after_max_attempts(self, generator, sleep):
+        generator.client.messages.create.side_effect = self.make_rate_limit_error()
+
+        with pytest.raises(anthropic.RateLimitError):
+            await generator.generate_response("hi")
+
+        assert generator.client.messages.create.call_count == AIGenerator.MAX_API_ATTEMPTS
+
+
 class TestConversationHistory:
-    def test_history_included_in_system_prompt(self, generator):
+    async def test_history_included_in_system_prompt(self, generator):
+        generator.client.messages.create.return_value = make_response(
+            "end_turn", [make_text_block("response")]
+        )
+        await generator.generate_response("hi", conversation_history="User: hello\nAI: hi there")
+
+        call_kwargs = generator.client.messages.create.call_args_list[0][1]
+        system_text = "".join(block["text"] for block in call_kwargs["system"])
+        assert "Previous conversation:" in system_text
+        assert "User: hello" in system_text
+        # History lives outside the cached prefix block
+        assert "cache_control" not in call_kwargs["system"][-1]
+
+    async def test_no_history_uses_base_prompt(self, generator):
+        generator.client.messages.create.return_value = make_response(
+            "end_turn", [make_text_block("response")]
+        )
+        await generator.generate_response("hi")
+
+        call_kwargs = generator.client.messages.create.call_args_list[0][1]
+        system_text = "".join(block["text"] for block in call_kwargs["system"])
+        assert "Previous conversation:" not in system_text
+
+    async def test_long_history_truncated_to_tail(self, generator):
         generator.client.messages.create.return_value = make_response(
             "end_turn", [make_text_block("response")]
         )
-        generator.generate_response("hi", conversation_history="User: hello\nAI: hi there")
+        history = "User: old question\n" + "x" * AIGenerator.MAX_HISTORY_CHARS + "\nUser: latest"
+        await generator.generate_response("hi", conversation_history=history)
 
         call_kwargs = generator.client.messages.create.call_args_list[0][1]
-        assert "Previous conversation:" in call_kwargs["system"]
-        assert "User: hello" in call_kwargs["system"]
+        history_text = call_kwargs["system"][-1]["text"]
+        assert "…[truncated]…" in history_text
+        assert "User: old question" not in history_text
+        assert history_text.endswith("User: latest")
+
 
-    def test_no_history_uses_base_prompt(self, generator):
+class TestPromptCaching:
+    async def test_static_prefix_marked_for_caching(self, generator, tool_manager, sample_tools):
         generator.client.messages.create.return_value = make_response(
             "end_turn", [make_text_block("response")]
         )
-        generator.generate_response("hi")
+        await generator.generate_response(
+            "hi", conversation_history="User: hello", tools=sample_tools, tool_manager=tool_manager
+        )
 
         call_kwargs = generator.client.messages.create.call_args_list[0][1]
-        assert "Previous conversation:" not in call_kwargs["system"]
+        assert call_kwargs["system"][0]["text"] == AIGenerator.SYSTEM_PROMPT
+        assert call_kwargs["system"][0]["cache_control"] == {"type": "ephemeral"}
+        assert call_kwargs["tools"][-1]["cache_control"] == {"type": "ephemeral"}
+        # Caller's tool definitions are not mutated
+        assert "cache_control" not in sample_tools[-1]
+
+    async def test_cacheable_tool_copy_reused_for_same_tools(self, generator, sample_tools):
+        generator.client.messages.create.return_value = make_response(
+            "end_turn", [make_text_block("response")]
+        )
+        await generator.generate_response("a", tools=sample_tools)
+        await generator.generate_response("b", tools=sample_tools)
+        await generator.generate_response("c", tools=[*sample_tools])
+
+        calls = generator.client.messages.create.call_args_list
+        assert calls[0][1]["tools"] is calls[1][1]["tools"]
+        assert calls[2][1]["tools"] is not calls[0][1]["tools"]
+        assert calls[2][1]["tools"] == calls[0][1]["tools"]
 
 
 class TestMixedContentBlocks:
-    def test_text_extracted_from_mixed_response(self, generator):
+    async def test_text_extracted_from_mixed_response(self, generator):
         response = make_response(
             "end_turn",
             [make_text_block("The answer"), make_tool_use_block("t1", "search", {"q": "x"})],
         )
         generator.client.messages.create.return_value = response
 
-        result = generator.generate_response("test")
+        result = await generator.generate_response("test")
         assert result == "The answer"
 
     def test_fallback_when_no_text_block(self, generator):
@@ -230,7 +476,7 @@ class TestMixedContentBlocks:
 
 
 class TestNoToolManager:
-    def test_tool_use_response_without_manager_extracts_text(self, generator, sample_tools):
+    async def test_tool_use_response_without_manager_extracts_text(self, generator, sample_tools):
         """If tool_manager is None, tool_use responses should still return any text content."""
         response = make_response(
             "tool_use",
@@ -238,6 +484,292 @@ class TestNoToolManager:
         )
         generator.client.messages.create.return_value = response
 
-        result = generator.generate_response("test", tools=sample_tools)
+        result = await generator.generate_response("test", tools=sample_tools)
         assert result == "Partial text"
         assert generator.client.messages.create.call_count == 1
+
+
+class TestStreaming:
+    @pytest.fixture
+    def tool_response(self):
+        return make_response(
+            "tool_use", [make_tool_use_block("t1", "search_course_content", {"query": "x"})]
+        )
+
+    async def test_no_tools_streams_text_deltas(self, generator):
+        generator.client.messages.stream = MagicMock(
+            return_value=FakeStream(
+                make_response("end_turn", [make_streamed_text_block("Hel", "lo!")])
+            )
+        )
+
+        chunks = [chunk async for chunk in generator.stream_response("hi")]
+
+        assert chunks == ["Hel", "lo!"]
+        generator.client.messages.create.assert_not_called()
+
+    async def test_direct_answer_with_tools_streams_text_deltas(
+        self, generator, tool_manager, sample_tools
+    ):
+        generator.client.messages.stream = MagicMock(
+            return_value=FakeStream(
+                make_response("end_turn", [make_streamed_text_block("Direct ", "answer")])
+            )
+        )
+
+        chunks = [
+            chunk
+            async for chunk in generator.stream_response(
+                "hi", tools=sample_tools, tool_manager=tool_manager
+            )
+        ]
+
+        assert chunks == ["Direct ", "answer"]
+        assert "tools" in generator.client.messages.stream.call_args[1]
+        generator.client.messages.create.assert_not_called()
+        tool_manager.execute_tool.assert_not_called()
+
+    async def test_forced_final_turn_is_streamed(
+        self, generator, tool_manager, sample_tools, tool_response
+    ):
+        final_response = make_response("end_turn", [make_streamed_text_block("Final ", "answer")])
+        generator.client.messages.stream = MagicMock(
+            side_effect=[
+                FakeStream(tool_response),
+                FakeStream(tool_response),
+                FakeStream(final_response),
+            ]
+        )
+
+        chunks = [
+            chunk
+            async for chunk in generator.stream_response(
+                "q", tools=sample_tools, tool_manager=tool_manager
+            )
+        ]
+
+        assert chunks == ["Final ", "answer"]
+        # Two tool rounds, then the tool-less final turn
+        assert generator.client.messages.stream.call_count == 3
+        stream_kwargs = generator.client.messages.stream.call_args[1]
+        assert "tools" not in stream_kwargs
+        assert len(stream_kwargs["messages"]) == 5
+
+    async def test_text_before_tool_call_is_separated_from_answer(
+        self, generator, tool_manager, sample_tools
+    ):
+        tool_round = make_response(
+            "tool_use",
+            [
+                make_text_block("Let me search."),
+                make_tool_use_block("t1", "search_course_content", {"query": "x"}),
+            ],
+        )
+        answer = make_response("end_turn", [make_text_block("Answer")])
+        generator.client.messages.stream = MagicMock(
+            side_effect=[FakeStream(tool_round), FakeStream(answer)]
+        )
+
+        chunks = [
+            chunk
+            async for chunk in generator.stream_response(
+                "q", tools=sample_tools, tool_manager=tool_manager
+            )
+        ]
+
+        assert chunks == ["Let me search.", "\n\nAnswer"]
+
+
+class TestStreamedToolRounds:
+    @pytest.fixture
+    def streaming_generator(self, generator):
+        generator.stream_tools = True
+        generator.client.messages.stream = MagicMock()
+        return generator
+
+    async def test_tool_starts_before_message_completes(
+        self, streaming_generator, tool_manager, sample_tools
+    ):
+        tool_ran = threading.Event()
+
+        def execute_tool(name, **kwargs):
+            tool_ran.set()
+            return "found"
+
+        tool_manager.execute_tool.side_effect = execute_tool
+        started_before_final = []
+
+        async def before_final():
+            started_before_final.append(await asyncio.to_thread(tool_ran.wait, 1))
+
+        tool_response = make_response(
+            "tool_use", [make_tool_use_block("t1", "search_course_content", {"query": "x"})]
+        )
+        text_response = make_response("end_turn", [make_text_block("Answer")])
+        streaming_generator.client.messages.stream.side_effect = [
+            FakeStream(tool_response, before_final),
+            FakeStream(text_response),
+        ]
+
+        result = await streaming_generator.generate_response(
+            "q", tools=sample_tools, tool_manager=tool_manager
+        )
+
+        assert result == "Answer"
+        assert started_before_final == [True]
+        tool_manager.execute_tool.assert_called_once_with("search_course_content", query="x")
+        streaming_generator.client.messages.create.assert_not_called()
+        second_call_messages = streaming_generator.client.messages.stream.call_args_list[1][1][
+            "messages"
+        ]
+        assert second_call_messages[2]["content"][0]["content"] == "found"
+
+    async def test_tool_from_retried_attempt_is_dropped(
+        self, streaming_generator, search_manager, search_store, sample_tools
+    ):
+        stale_failed = threading.Event()
+        x_searched = threading.Event()
+        old_searched = threading.Event()
+
+        def search(query, course_name=None, lesson_number=None):
+            if query == "stale":
+                stale_failed.set()
+                raise RuntimeError("stale tool broke")
+            if query == "old":
+                # Cancelling the task does not stop this thread; it finishes after the retry
+                x_searched.wait(1)
+                time.sleep(0.05)
+                old_searched.set()
+            else:
+                x_searched.set()
+            return make_search_results(query)
+
+        search_store.search.side_effect = search
+
+        async def fail_after_stale_tool():
+            await asyncio.to_thread(stale_failed.wait, 1)
+            raise TestRetries.make_rate_limit_error({"retry-after": "0"})
+
+        stale_response = make_response(
+            "tool_use",
+            [
+                make_tool_use_block("t1", "search_course_content", {"query": "stale"}),
+                make_tool_use_block("t2", "search_course_content", {"query": "old"}),
+            ],
+        )
+        tool_response = make_response(
+            "tool_use", [make_tool_use_block("t3", "search_course_content", {"query": "x"})]
+        )
+        text_response = make_response("end_turn", [make_text_block("Answer")])
+        streaming_generator.client.messages.stream.side_effect = [
+            FakeStream(stale_response, fail_after_stale_tool),
+            FakeStream(tool_response),
+            FakeStream(text_response),
+        ]
+
+        result = await streaming_generator.generate_response(
+            "q", tools=sample_tools, tool_manager=search_manager
+        )
+        await asyncio.to_thread(old_searched.wait, 1)
+        await asyncio.sleep(0.05)
+
+        assert result == "Answer"
+        second_round = streaming_generator.client.messages.stream.call_args_list[2][1]
+        # Stale calls neither disable tools nor leak into the tool results or sources
+        assert "tools" in second_round
+        assert second_round["messages"][2]["content"] == [
+            {"type": "tool_result", "tool_use_id": "t3", "content": "[x]\ncontent"}
+        ]
+        assert search_manager.get_last_sources() == [{"title": "x", "url": None}]
+
+    async def test_failed_round_retrieves_started_tool_errors(
+        self, streaming_generator, tool_manager, sample_tools
+    ):
+        loop = asyncio.get_running_loop()
+        unhandled = []
+        loop.set_exception_handler(lambda loop, context: unhandled.append(context))
+        tool_done = threading.Event()
+
+        def execute_tool(name, **kwargs):
+            tool_done.set()
+            raise RuntimeError("tool broke")
+
+        tool_manager.execute_tool.side_effect = execute_tool
+
+        async def fail_after_tool():
+            await asyncio.to_thread(tool_done.wait, 1)
+            await asyncio.sleep(0.01)
+            raise ValueError("bad request")
+
+        tool_response = make_response(
+            "tool_use", [make_tool_use_block("t1", "search_course_content", {"query": "x"})]
+        )
+        streaming_generator.client.messages.stream.side_effect = [
+            FakeStream(tool_response, fail_after_tool)
+        ]
+
+        try:
+            with pytest.raises(ValueError):
+                await streaming_generator.generate_response(
+                    "q", tools=sample_tools, tool_manager=tool_manager
+                )
+            gc.collect()
+        finally:
+            loop.set_exception_handler(None)
+
+        assert unhandled == []
+
+    async def test_no_tool_manager_uses_create(self, streaming_generator, sample_tools):
+        streaming_generator.client.messages.create.return_value = make_response(
+            "end_turn", [make_text_block("Direct")]
+        )
+
+        result = await streaming_generator.generate_response("q", tools=sample_tools)
+
+        assert result == "Direct"
+        streaming_generator.client.messages.stream.assert_not_called()
+
+
+class TestBatchGeneration:
+    @staticmethod
+    def make_batch_entry(custom_id, text=None):
+        if text is None:
+            return SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(type="errored"))
+        message = make_response("end_turn", [make_text_block(text)])
+        return SimpleNamespace(
+            custom_id=custom_id, result=SimpleNamespace(type="succeeded", message=message)
+        )
+
+    async def test_batches_are_split_polled_and_ordered(self, generator):
+        generator.BATCH_SIZE = 2
+        generator.BATCH_POLL_INITIAL_DELAY = 0
+        batches = generator.client.messages.batches
+        batches.create = AsyncMock(
+            side_effect=[
+                SimpleNamespace(id="b1", processing_status="in_progress"),
+                SimpleNamespace(id="b2", processing_status="ended"),
+            ]
+        )
+        batches.retrieve = AsyncMock(
+            return_value=SimpleNamespace(id="b1", processing_status="ended")
+        )
+
+        async def results(batch_id):
+            entries = {
+                "b1": [self.make_batch_entry("1", "second"), self.make_batch_entry("0", "first")],
+                "b2": [self.make_batch_entry("0")],
+            }[batch_id]
+            for entry in entries:
+                yield entry
+
+        batches.results = AsyncMock(side_effect=lambda batch_id: results(batch_id))
+
+        responses = await generator.generate_batch([("q1", None), ("q2", "User: hi"), ("q3", None)])
+
+        assert responses == ["first", "second", AIGenerator.FALLBACK_RESPONSE]
+        assert batches.create.await_count == 2
+        batches.retrieve.assert_awaited_once_with("b1")
+        first_requests = batches.create.call_args_list[0][1]["requests"]
+        assert [r["custom_id"] for r in first_requests] == ["0", "1"]
+        assert "tools" not in first_requests[0]["params"]
+        assert "Previous conversation:" in first_requests[1]["params"]["system"][-1]["text"]
@@ -1,16 +1,24 @@
 """API endpoint tests for the FastAPI application"""
+import functools
+import json
+import operator
+import httpx
+import orjson
 import pytest
-from fastapi import FastAPI, HTTPException
-from fastapi.testclient import TestClient
+import pytest_asyncio
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-from unittest.mock import patch, MagicMock
-import tempfile
-from pathlib import Path
+from types import MappingProxyType
+from typing import Annotated, Any, List, Optional
 
-pytestmark = pytest.mark.api
+pytestmark = [
+    pytest.mark.api,
+    pytest.mark.asyncio(loop_scope="session"),
+    # Keep the session-scoped app and client on a single xdist worker
+    pytest.mark.xdist_group("api"),
+]
 
 
 # Pydantic models (copied from app.py to avoid import issues)
@@ -35,75 +43,168 @@ class CourseStats(BaseModel):
     course_titles: List[str]
 
 
-def create_test_app(mock_rag_system):
-    """Create a test FastAPI app without static file mounting"""
-    app = FastAPI(title="Course Materials RAG System (Test)", root_path="")
+# Shared literals; dicts are read-only so accidental mutation fails fast
+_SESSION_ID = "test-session-123"
+_PAYLOAD_MIN = MappingProxyType({"query": "test"})
+_PAYLOAD_NULL_SESSION = MappingProxyType({"query": "test query", "session_id": None})
+
+# Request bodies serialized once at import instead of re-encoded on every request
+SAMPLES = MappingProxyType({
+    "with_session": MappingProxyType({"query": "What is Python?", "session_id": _SESSION_ID}),
+    "no_session": MappingProxyType({"query": "Explain variables in JavaScript"}),
+    "test": _PAYLOAD_MIN,
+    "test_query": MappingProxyType({"query": "test query"}),
+    "empty": MappingProxyType({"query": ""}),
+    "null_session": _PAYLOAD_NULL_SESSION,
+})
+# exclude_unset keeps bodies as sent: only "null_session" carries an explicit session_id null
+_PAYLOADS = {
+    name: QueryRequest(**d).model_dump_json(exclude_unset=True).encode()
+    for name, d in SAMPLES.items()
+}
+_JSON_HDR = httpx.Headers({"content-type": "application/json"})
+
+# Sources built as models once, so response validation accepts them without re-validating fields
+SOURCES = (
+    Source(title="Course A - Lesson 1", url="https://example.com/a"),
+    Source(title="Course B - Lesson 2", url=None),
+)
+
+
+def _json(response: httpx.Response):
+    """Decode a JSON response body with orjson"""
+    return orjson.loads(response.content)
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def parse_sse(body: str) -> list:
+    """Split a server-sent event stream into (event, data) pairs"""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        event_line, data_line = frame.split("\n")
+        events.append((event_line.removeprefix("event: "), json.loads(data_line.removeprefix("data: "))))
+    return events
+
+
+def get_rag_system():
+    """Dependency for the RAG system; overridden with a mock by the client fixture"""
+    raise RuntimeError("No RAG system: the client fixture must override get_rag_system")
+
+
+# Test app without static file mounting (same logic as app.py but with an injectable RAG system)
+app = FastAPI(
+    title="Course Materials RAG System (Test)",
+    root_path="",
+    default_response_class=ORJSONResponse,
+)
+
+# TrustedHostMiddleware is left out since allowed_hosts=["*"] is a no-op
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["*"],
+)
+
+
+@app.post("/api/query", response_model=QueryResponse)
+async def query_documents(
+    request: QueryRequest, rag_system: Annotated[Any, Depends(get_rag_system)]
+):
+    try:
+        session_id = request.session_id
+        if not session_id:
+            session_id = rag_system.session_manager.create_session()
+
+        answer, sources = await rag_system.query(request.query, session_id)
+
+        return {"answer": answer, "sources": sources, "session_id": session_id}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@app.post("/api/query/stream")
+async def stream_query_documents(
+    request: QueryRequest, rag_system: Annotated[Any, Depends(get_rag_system)]
+):
+    try:
+        session_id = request.session_id
+        if not session_id:
+            session_id = rag_system.session_manager.create_session()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    async def event_stream():
+        try:
+            async for event, data in rag_system.stream_query(request.query, session_id):
+                if event == "text":
+                    yield format_sse("text", {"text": data})
+                else:
+                    yield format_sse("done", {"sources": data, "session_id": session_id})
+        except Exception as e:
+            yield format_sse("error", {"detail": str(e)})
 
-    # Add middleware (same as production)
-    app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-        expose_headers=["*"],
-    )
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
-    # Define endpoints inline (same logic as app.py but with our mock)
-    @app.post("/api/query", response_model=QueryResponse)
-    async def query_documents(request: QueryRequest):
-        try:
-            session_id = request.session_id
-            if not session_id:
-                session_id = mock_rag_system.session_manager.create_session()
 
-            answer, sources = mock_rag_system.query(request.query, session_id)
+@app.get("/api/courses", response_model=CourseStats)
+async def get_course_stats(rag_system: Annotated[Any, Depends(get_rag_system)]):
+    try:
+        analytics = rag_system.get_course_analytics()
+        return {
+            "total_courses": analytics["total_courses"],
+            "course_titles": analytics["course_titles"]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
 
-            return QueryResponse(
-                answer=answer,
-                sources=sources,
-                session_id=session_id
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
 
-    @app.get("/api/courses", response_model=CourseStats)
-    async def get_course_stats():
-        try:
-            analytics = mock_rag_system.get_course_analytics()
-            return CourseStats(
-                total_courses=analytics["total_courses"],
-                course_titles=analytics["course_titles"]
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+# Simple root endpoint for testing
+@app.get("/")
+async def root():
+    return {"status": "ok"}
 
-    # Simple root endpoint for testing
-    @app.get("/")
-    async def root():
-        return {"status": "ok"}
 
-    return app
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def client(mock_rag_system):
+    """Create an in-process async HTTP client for the test app with a mocked RAGSystem"""
+    app.dependency_overrides[get_rag_system] = lambda: mock_rag_system
+    # Unhandled app errors come back as 500 responses rather than re-raised tracebacks
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://t", follow_redirects=False
+    ) as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="session")
+def post_query(client):
+    """POST to /api/query with the JSON content-type bound once"""
+    return functools.partial(client.post, "/api/query", headers=_JSON_HDR)
 
 
 @pytest.fixture
-def test_client(mock_rag_system):
-    """Create a TestClient with test app and mocked RAGSystem"""
-    app = create_test_app(mock_rag_system)
-    client = TestClient(app)
-    return client
+def rag_with(mock_rag_system, request):
+    """Mocked RAGSystem whose query returns the (answer, sources) given as the indirect param"""
+    mock_rag_system.query.return_value = request.param
+    return mock_rag_system
 
 
 class TestQueryEndpoint:
     """Tests for POST /api/query endpoint"""
 
-    def test_query_with_session_id(self, test_client, mock_rag_system, sample_query_request):
+    async def test_query_with_session_id(self, post_query, mock_rag_system):
         """Test query endpoint with existing session ID"""
-        response = test_client.post("/api/query", json=sample_query_request)
+        response = await post_query(content=_PAYLOADS["with_session"])
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         # Verify response structure
         assert "answer" in data
@@ -112,90 +213,98 @@ class TestQueryEndpoint:
 
         # Verify response content
         assert data["answer"] == "This is a test answer about the course content."
-        assert data["session_id"] == "test-session-123"
+        assert data["session_id"] == _SESSION_ID
         assert len(data["sources"]) == 2
 
         # Verify RAG system was called correctly
         mock_rag_system.query.assert_called_once_with(
-            sample_query_request["query"],
-            sample_query_request["session_id"]
+            SAMPLES["with_session"]["query"],
+            SAMPLES["with_session"]["session_id"]
         )
 
-    def test_query_without_session_id(self, test_client, mock_rag_system, sample_query_request_no_session):
+    async def test_query_without_session_id(self, post_query, mock_rag_system):
         """Test query endpoint creates new session when none provided"""
-        response = test_client.post("/api/query", json=sample_query_request_no_session)
+        response = await post_query(content=_PAYLOADS["no_session"])
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         # Verify new session was created
-        assert data["session_id"] == "test-session-123"
+        assert data["session_id"] == _SESSION_ID
         mock_rag_system.session_manager.create_session.assert_called_once()
 
         # Verify query was processed
         mock_rag_system.query.assert_called_once()
 
-    def test_query_with_sources(self, test_client, mock_rag_system):
+    @pytest.mark.parametrize("rag_with", [("Answer with sources", SOURCES)], indirect=True)
+    async def test_query_with_sources(self, post_query, rag_with):
         """Test query endpoint returns sources correctly"""
-        mock_rag_system.query.return_value = (
-            "Answer with sources",
-            [
-                {"title": "Course A - Lesson 1", "url": "https://example.com/a"},
-                {"title": "Course B - Lesson 2", "url": None}
-            ]
-        )
-
-        response = test_client.post("/api/query", json={"query": "test query"})
+        response = await post_query(content=_PAYLOADS["test_query"])
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         assert len(data["sources"]) == 2
         assert data["sources"][0]["title"] == "Course A - Lesson 1"
         assert data["sources"][0]["url"] == "https://example.com/a"
         assert data["sources"][1]["url"] is None
 
-    def test_query_missing_query_field(self, test_client):
+    async def test_query_missing_query_field(self, client):
         """Test query endpoint with missing required field"""
-        response = test_client.post("/api/query", json={"session_id": "123"})
+        response = await client.post("/api/query", json={"session_id": "123"})
 
         assert response.status_code == 422  # Validation error
 
-    def test_query_empty_string(self, test_client, mock_rag_system):
+    async def test_query_empty_string(self, post_query, mock_rag_system):
         """Test query endpoint with empty query string"""
-        response = test_client.post("/api/query", json={"query": ""})
+        response = await post_query(content=_PAYLOADS["empty"])
 
         assert response.status_code == 200
         # Empty string is valid, RAG system should handle it
         mock_rag_system.query.assert_called_once()
 
-    def test_query_handles_rag_exception(self, test_client, mock_rag_system):
-        """Test query endpoint handles RAG system exceptions"""
-        mock_rag_system.query.side_effect = Exception("Database connection failed")
+class TestStreamQueryEndpoint:
+    """Tests for POST /api/query/stream endpoint"""
+
+    async def test_stream_emits_text_then_done(self, client, mock_rag_system):
+        """Test streaming endpoint emits text deltas followed by sources"""
+        response = await client.post(
+            "/api/query/stream", content=_PAYLOADS["with_session"], headers=_JSON_HDR
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
 
-        response = test_client.post("/api/query", json={"query": "test"})
+        events = parse_sse(response.text)
+        text = "".join(data["text"] for event, data in events if event == "text")
+        assert text == "This is a test answer about the course content."
 
-        assert response.status_code == 500
-        assert "Database connection failed" in response.json()["detail"]
+        event, data = events[-1]
+        assert event == "done"
+        assert data["session_id"] == _SESSION_ID
+        assert len(data["sources"]) == 2
 
-    def test_query_handles_session_manager_exception(self, test_client, mock_rag_system):
-        """Test query endpoint handles session creation exceptions"""
-        mock_rag_system.session_manager.create_session.side_effect = Exception("Session error")
+    async def test_stream_reports_errors_as_events(self, client, mock_rag_system):
+        """Test streaming endpoint reports mid-stream failures as an error event"""
+        mock_rag_system.stream_query.side_effect = Exception("Stream failed")
 
-        response = test_client.post("/api/query", json={"query": "test"})
+        response = await client.post(
+            "/api/query/stream", content=_PAYLOADS["test"], headers=_JSON_HDR
+        )
 
-        assert response.status_code == 500
+        assert response.status_code == 200
+        assert parse_sse(response.text) == [("error", {"detail": "Stream failed"})]
 
 
 class TestCoursesEndpoint:
     """Tests for GET /api/courses endpoint"""
 
-    def test_get_courses_success(self, test_client, mock_rag_system):
+    async def test_get_courses_success(self, client, mock_rag_system):
         """Test courses endpoint returns correct analytics"""
-        response = test_client.get("/api/courses")
+        response = await client.get("/api/courses")
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         # Verify response structure
         assert "total_courses" in data
@@ -209,86 +318,116 @@ class TestCoursesEndpoint:
         # Verify RAG system was called
         mock_rag_system.get_course_analytics.assert_called_once()
 
-    def test_get_courses_empty_catalog(self, test_client, mock_rag_system):
+    async def test_get_courses_empty_catalog(self, client, mock_rag_system):
         """Test courses endpoint with no courses"""
         mock_rag_system.get_course_analytics.return_value = {
             "total_courses": 0,
             "course_titles": []
         }
 
-        response = test_client.get("/api/courses")
+        response = await client.get("/api/courses")
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         assert data["total_courses"] == 0
         assert data["course_titles"] == []
 
-    def test_get_courses_handles_exception(self, test_client, mock_rag_system):
-        """Test courses endpoint handles exceptions"""
-        mock_rag_system.get_course_analytics.side_effect = Exception("Vector store error")
 
-        response = test_client.get("/api/courses")
+class TestErrorHandling:
+    """Tests for RAG system failures surfacing as HTTP 500s"""
 
-        assert response.status_code == 500
-        assert "Vector store error" in response.json()["detail"]
+    # The 500 branch lives inside the handlers, so call them directly without the HTTP stack
+    @pytest.mark.parametrize(
+        "handler,payload,mock_path,msg",
+        [
+            (query_documents, _PAYLOAD_MIN, "query", "Database connection failed"),
+            (query_documents, _PAYLOAD_MIN, "session_manager.create_session", "Session error"),
+            (get_course_stats, None, "get_course_analytics", "Vector store error"),
+        ],
+    )
+    async def test_handler_raises_500_on_rag_exception(
+        self, mock_rag_system, handler, payload, mock_path, msg
+    ):
+        """Test handlers turn RAG system exceptions into 500 HTTPExceptions"""
+        operator.attrgetter(mock_path)(mock_rag_system).side_effect = Exception(msg)
+        args = () if payload is None else (QueryRequest(**payload),)
+
+        with pytest.raises(HTTPException) as exc_info:
+            await handler(*args, rag_system=mock_rag_system)
+
+        assert exc_info.value.status_code == 500
+        assert msg in exc_info.value.detail
 
 
 class TestRootEndpoint:
     """Tests for GET / endpoint"""
 
-    def test_root_endpoint_exists(self, test_client):
+    async def test_root_endpoint_exists(self, client):
         """Test that root endpoint is accessible"""
-        response = test_client.get("/")
+        response = await client.get("/")
 
         assert response.status_code == 200
-        assert response.json() == {"status": "ok"}
+        assert response.content == b'{"status":"ok"}'
+
+
+@pytest.fixture(scope="class")
+def preflight_request():
+    """CORS preflight request built once per test class and resent by each test"""
+    return httpx.Request(
+        "OPTIONS",
+        "http://t/api/query",
+        headers={
+            "Origin": "http://localhost:3000",
+            "Access-Control-Request-Method": "POST",
+            "Access-Control-Request-Headers": "content-type, x-trace-id",
+        }
+    )
 
 
 class TestCORSHeaders:
-    """Tests for CORS middleware configuration"""
+    """Tests for CORS handling"""
 
-    def test_cors_headers_present(self, test_client):
+    async def test_cors_headers_present(self, client, preflight_request):
         """Test that CORS headers are properly set"""
-        response = test_client.options(
-            "/api/query",
-            headers={
-                "Origin": "http://localhost:3000",
-                "Access-Control-Request-Method": "POST"
-            }
-        )
+        response = await client.send(preflight_request)
 
-        # CORS should allow the request
+        # With credentials allowed, the origin and requested headers are echoed back
         assert response.status_code in [200, 204]
+        assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
+        assert response.headers["access-control-allow-credentials"] == "true"
+        assert response.headers["access-control-allow-headers"] == "content-type, x-trace-id"
+
+    async def test_cors_header_on_cross_origin_response(self, client):
+        """Test that regular cross-origin responses carry the CORS headers"""
+        response = await client.get("/", headers={"Origin": "http://localhost:3000"})
+
+        assert response.status_code == 200
+        assert response.headers["access-control-allow-origin"] == "*"
+        assert response.headers["access-control-allow-credentials"] == "true"
+        assert response.headers["access-control-expose-headers"] == "*"
 
 
 class TestRequestValidation:
     """Tests for request validation and edge cases"""
 
-    def test_query_with_extra_fields(self, test_client, mock_rag_system):
+    async def test_query_with_extra_fields(self, client, mock_rag_system):
         """Test query endpoint ignores extra fields"""
-        response = test_client.post("/api/query", json={
-            "query": "test",
+        response = await client.post("/api/query", json={
+            **_PAYLOAD_MIN,
             "extra_field": "should be ignored"
         })
 
         assert response.status_code == 200
 
-    def test_query_with_invalid_json(self, test_client):
+    async def test_query_with_invalid_json(self, post_query):
         """Test query endpoint with malformed JSON"""
-        response = test_client.post(
-            "/api/query",
-            data="not valid json",
-            headers={"Content-Type": "application/json"}
-        )
+        response = await post_query(content="not valid json")
 
         assert response.status_code == 422
 
-    def test_query_with_null_values(self, test_client, mock_rag_system):
+    async def test_query_with_null_values(self, post_query, mock_rag_system):
         """Test query endpoint with null session_id"""
-        response = test_client.post("/api/query", json={
-            "query": "test query",
-            "session_id": None
-        })
+        response = await post_query(content=_PAYLOADS["null_session"])
 
         assert response.status_code == 200
         # Should create new session when session_id is null
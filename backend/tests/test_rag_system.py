@@ -0,0 +1,72 @@
+"""Unit tests for RAGSystem query orchestration"""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from rag_system import RAGSystem
+from vector_store import SearchResults
+
+pytestmark = pytest.mark.unit
+
+
+def fake_search(query, course_name=None, lesson_number=None):
+    # Each search hits the course named by the last word of its query
+    return SearchResults(
+        documents=["content"],
+        metadata=[{"course_title": query.split()[-1], "lesson_number": None}],
+        distances=[0.1],
+    )
+
+
+class InterleavingGenerator:
+    """Runs a search, then waits until every concurrent request has run its own"""
+
+    def __init__(self, parties: int):
+        self.barrier = asyncio.Barrier(parties)
+
+    async def generate_response(
+        self, query, conversation_history=None, tools=None, tool_manager=None, cache_key=None
+    ):
+        _, sources = tool_manager.execute_tool_with_sources("search_course_content", query=query)
+        tool_manager.record_sources("search_course_content", sources)
+        await self.barrier.wait()
+        return "answer"
+
+    async def stream_response(
+        self, query, conversation_history=None, tools=None, tool_manager=None, cache_key=None
+    ):
+        yield await self.generate_response(query, conversation_history, tools, tool_manager)
+
+
+@pytest.fixture
+def rag(mock_config):
+    with patch("rag_system.VectorStore") as MockVectorStore:
+        store = MockVectorStore.return_value
+        store.search.side_effect = fake_search
+        store.get_course_link.return_value = None
+        rag = RAGSystem(mock_config)
+    rag.ai_generator = InterleavingGenerator(parties=2)
+    return rag
+
+
+class TestConcurrentQueries:
+    async def test_overlapping_queries_keep_their_own_sources(self, rag):
+        (_, python_sources), (_, rust_sources) = await asyncio.gather(
+            rag.query("Python"), rag.query("Rust")
+        )
+
+        assert python_sources == [{"title": "Python", "url": None}]
+        assert rust_sources == [{"title": "Rust", "url": None}]
+
+    async def test_overlapping_streams_keep_their_own_sources(self, rag):
+        async def stream_sources(query):
+            events = [event async for event in rag.stream_query(query)]
+            return events[-1]
+
+        python_event, rust_event = await asyncio.gather(
+            stream_sources("Python"), stream_sources("Rust")
+        )
+
+        assert python_event == ("sources", [{"title": "Python", "url": None}])
+        assert rust_event == ("sources", [{"title": "Rust", "url": None}])
@@ -0,0 +1,128 @@
+"""Unit tests for the semantic response cache"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from ai_generator import AIGenerator
+from response_cache import CachingAIGenerator
+
+pytestmark = pytest.mark.unit
+
+PROMPT = "Answer this question about course materials: {}"
+
+# Fixed embeddings: "what is python?" and "tell me about python" are near-duplicates
+EMBEDDINGS = {
+    "what is python?": [1.0, 0.0, 0.0],
+    "tell me about python": [0.98, 0.2, 0.0],
+    "what is javascript?": [0.0, 1.0, 0.0],
+    # Templated prompts: the shared prefix dominates, pulling different questions together
+    PROMPT.format("what is python?"): [0.1, 0.0, 1.0],
+    PROMPT.format("what is javascript?"): [0.0, 0.1, 1.0],
+}
+
+
+def fake_embedding_function(texts):
+    return [EMBEDDINGS[text] for text in texts]
+
+
+@pytest.fixture
+def inner_generator():
+    gen = MagicMock()
+    gen.SYSTEM_PROMPT = AIGenerator.SYSTEM_PROMPT
+    gen.generate_response = AsyncMock(return_value="generated answer")
+    return gen
+
+
+@pytest.fixture
+def cache(inner_generator):
+    return CachingAIGenerator(inner_generator, fake_embedding_function)
+
+
+@pytest.fixture
+def tool_manager():
+    mgr = MagicMock()
+    mgr.get_last_sources.return_value = []
+    return mgr
+
+
+class TestCacheHits:
+    async def test_exact_repeat_is_served_from_cache(self, cache, inner_generator):
+        first = await cache.generate_response("what is python?")
+        second = await cache.generate_response("what is python?")
+
+        assert first == second == "generated answer"
+        assert inner_generator.generate_response.await_count == 1
+
+    async def test_semantically_near_query_is_served_from_cache(self, cache, inner_generator):
+        await cache.generate_response("what is python?")
+        result = await cache.generate_response("tell me about python")
+
+        assert result == "generated answer"
+        assert inner_generator.generate_response.await_count == 1
+
+    async def test_unrelated_query_misses(self, cache, inner_generator):
+        await cache.generate_response("what is python?")
+        await cache.generate_response("what is javascript?")
+
+        assert inner_generator.generate_response.await_count == 2
+
+
+class TestCacheKeys:
+    async def test_different_history_misses(self, cache, inner_generator):
+        await cache.generate_response("what is python?", conversation_history="User: hi")
+        await cache.generate_response("what is python?", conversation_history="User: bye")
+
+        assert inner_generator.generate_response.await_count == 2
+
+    async def test_response_with_sources_is_not_cached(self, cache, inner_generator, tool_manager):
+        tool_manager.get_last_sources.return_value = [{"title": "Course", "url": None}]
+
+        await cache.generate_response("what is python?", tool_manager=tool_manager)
+        await cache.generate_response("what is python?", tool_manager=tool_manager)
+
+        assert inner_generator.generate_response.await_count == 2
+
+    async def test_response_without_sources_is_cached(self, cache, inner_generator, tool_manager):
+        await cache.generate_response("what is python?", tool_manager=tool_manager)
+        await cache.generate_response("what is python?", tool_manager=tool_manager)
+
+        assert inner_generator.generate_response.await_count == 1
+
+    async def test_templated_prompts_are_matched_on_the_raw_question(self, cache, inner_generator):
+        for question in ("what is python?", "what is javascript?"):
+            await cache.generate_response(PROMPT.format(question), cache_key=question)
+
+        assert inner_generator.generate_response.await_count == 2
+        inner_generator.generate_response.assert_awaited_with(
+            query=PROMPT.format("what is javascript?"),
+            conversation_history=None,
+            tools=None,
+            tool_manager=None,
+        )
+
+
+class TestEviction:
+    async def test_least_recently_used_entry_is_evicted(self, inner_generator):
+        cache = CachingAIGenerator(inner_generator, fake_embedding_function, max_entries=1)
+
+        await cache.generate_response("what is python?")
+        await cache.generate_response("what is javascript?")
+        await cache.generate_response("what is python?")
+
+        assert inner_generator.generate_response.await_count == 3
+
+
+class TestStreaming:
+    async def test_streamed_response_is_cached_and_replayed(self, cache, inner_generator):
+        async def stream_response(**kwargs):
+            yield "generated "
+            yield "answer"
+
+        inner_generator.stream_response = MagicMock(side_effect=stream_response)
+
+        first = [chunk async for chunk in cache.stream_response("what is python?")]
+        second = [chunk async for chunk in cache.stream_response("tell me about python")]
+
+        assert first == ["generated ", "answer"]
+        assert second == ["generated answer"]
+        assert inner_generator.stream_response.call_count == 1
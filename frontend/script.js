@@ -97,7 +97,7 @@ async function sendMessage() {
     chatMessages.scrollTop = chatMessages.scrollHeight;
 
     try {
-        const response = await fetch(`${API_URL}/query`, {
+        const response = await fetch(`${API_URL}/query/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -110,16 +110,35 @@ async function sendMessage() {
 
         if (!response.ok) throw new Error('Query failed');
 
-        const data = await response.json();
-        
-        // Update session ID if new
-        if (!currentSessionId) {
-            currentSessionId = data.session_id;
-        }
+        // Render the answer incrementally as server-sent events arrive
+        let answer = '';
+        let messageContent = null;
+        await readEventStream(response, (event, data) => {
+            if (event === 'text') {
+                if (!messageContent) {
+                    loadingMessage.remove();
+                    messageContent = createStreamingMessage();
+                }
+                answer += data.text;
+                messageContent.innerHTML = marked.parse(answer);
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (event === 'done') {
+                // Update session ID if new
+                if (!currentSessionId) {
+                    currentSessionId = data.session_id;
+                }
 
-        // Replace loading message with response
-        loadingMessage.remove();
-        addMessage(data.answer, 'assistant', data.sources);
+                // Replace the streamed message with the final one including sources
+                if (messageContent) {
+                    messageContent.parentElement.remove();
+                } else {
+                    loadingMessage.remove();
+                }
+                addMessage(answer, 'assistant', data.sources);
+            } else if (event === 'error') {
+                throw new Error(data.detail);
+            }
+        });
 
     } catch (error) {
         // Replace loading message with error
@@ -132,6 +151,41 @@ async function sendMessage() {
     }
 }
 
+// Parse a server-sent event stream, invoking onEvent(event, data) per event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of frame.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+function createStreamingMessage() {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message assistant';
+    messageDiv.innerHTML = '<div class="message-content"></div>';
+    chatMessages.appendChild(messageDiv);
+    return messageDiv.querySelector('.message-content');
+}
+
 function createLoadingMessage() {
     const messageDiv = document.createElement('div');
     messageDiv.className = 'message assistant';